@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+"""
+Audio decoding helpers for the faster-whisper path.
+Decodes media to 16 kHz mono float32 arrays, optionally ahead of time in
+background threads so decoding overlaps model inference.
+"""
+
+import gc
+import math
+import os
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import av
+import numpy as np
+from faster_whisper.audio import decode_audio
+
+from tracing import span
+
+SAMPLING_RATE = 16000
+
+# Number of files decoded ahead of the one being transcribed (0 disables prefetch)
+DEFAULT_PREFETCH_FILES = 2
+
+# Upper bound on decoded-but-unconsumed audio held in memory (float32 at 16 kHz
+# is ~230 MB per hour)
+DEFAULT_PREFETCH_MAX_SECONDS = 2 * 3600
+
+
+def probe_duration(path: str):
+    """Return the media duration in seconds from container metadata, or None if unknown."""
+    try:
+        with av.open(path, mode="r", metadata_errors="ignore") as container:
+            if container.duration is not None:
+                return container.duration / av.time_base
+            stream = container.streams.audio[0]
+            if stream.duration is not None and stream.time_base is not None:
+                return float(stream.duration * stream.time_base)
+    except (av.error.FFmpegError, IndexError):
+        pass
+    return None
+
+
+def load_audio(path: str, sampling_rate: int = SAMPLING_RATE):
+    """Decode a media file to a mono float32 array."""
+    with span("decode", "audio", file=os.path.basename(path)):
+        return decode_audio(path, sampling_rate=sampling_rate)
+
+
+def iter_audio_blocks(path: str, block_seconds: float, sampling_rate: int = SAMPLING_RATE):
+    """
+    Decode a media file incrementally.
+
+    Only one block (plus one decoder frame) is held in memory at a time, so
+    memory use does not grow with the length of the input.
+
+    Args:
+        path: Media file path
+        block_seconds: Length of each block in seconds
+        sampling_rate: Target sample rate
+
+    Yields:
+        Mono float32 arrays of block_seconds each (the last one may be shorter)
+    """
+    block_samples = round(block_seconds * sampling_rate)
+    resampler = av.audio.resampler.AudioResampler(format="s16", layout="mono", rate=sampling_rate)
+    chunks = []
+    buffered = 0
+
+    def frames(container):
+        decoded = container.decode(audio=0)
+        while True:
+            try:
+                frame = next(decoded)
+            except StopIteration:
+                break
+            except av.error.InvalidDataError:
+                continue
+            frame.pts = None  # Ignore timestamp check.
+            yield frame
+        yield None  # Flush the resampler.
+
+    with av.open(path, mode="r", metadata_errors="ignore") as container:
+        for frame in frames(container):
+            for resampled in resampler.resample(frame):
+                chunk = resampled.to_ndarray().reshape(-1)
+                chunks.append(chunk)
+                buffered += len(chunk)
+
+                while buffered >= block_samples:
+                    samples = np.concatenate(chunks)
+                    yield samples[:block_samples].astype(np.float32) / 32768.0
+                    chunks = [samples[block_samples:]]
+                    buffered = len(chunks[0])
+
+    if buffered:
+        yield np.concatenate(chunks).astype(np.float32) / 32768.0
+
+    # Same workaround as faster_whisper.audio.decode_audio: resampler objects
+    # are not freed until the garbage collector runs.
+    del resampler
+    gc.collect()
+
+
+def prefetch_audio(
+    paths: list,
+    max_files: int = DEFAULT_PREFETCH_FILES,
+    max_seconds: float = DEFAULT_PREFETCH_MAX_SECONDS,
+    sampling_rate: int = SAMPLING_RATE,
+    skip_seconds: float = None
+):
+    """
+    Decode files ahead of the consumer.
+
+    While the caller works on one file, up to max_files following files are
+    decoded in background threads. A file is only scheduled if the queued
+    audio stays within max_seconds (a single file is always allowed, so an
+    oversized file still gets decoded, just without anything queued behind it).
+
+    Args:
+        paths: Media file paths, in processing order
+        max_files: Number of files to decode ahead. 0 disables decoding
+        max_seconds: Budget for queued decoded audio, in seconds
+        sampling_rate: Target sample rate
+        skip_seconds: Files longer than this, or of unknown length, are not
+            decoded (for windowed decoding)
+
+    Yields:
+        Tuples of (path, audio, error). audio is None if prefetch is disabled,
+        the file was skipped or decoding failed; error holds the decoding
+        exception, if any.
+    """
+    if max_files <= 0:
+        for path in paths:
+            yield path, None, None
+        return
+
+    pending = deque()
+    pending_seconds = 0.0
+    next_index = 0
+    next_seconds = None
+
+    with ThreadPoolExecutor(max_workers=max_files, thread_name_prefix="prefetch") as executor:
+
+        def schedule():
+            nonlocal pending_seconds, next_index, next_seconds
+            while next_index < len(paths) and len(pending) < max_files:
+                path = paths[next_index]
+                if next_seconds is None:
+                    next_seconds = probe_duration(path)
+                    if next_seconds is None:
+                        if skip_seconds is not None:
+                            # Unknown length (e.g. a livestream recording): leave it to windowed decoding
+                            next_seconds = math.inf
+                        else:
+                            # Assume the worst so nothing else queues behind it
+                            next_seconds = max_seconds
+                if skip_seconds is not None and next_seconds > skip_seconds:
+                    future = None
+                    next_seconds = 0.0
+                elif pending and pending_seconds + next_seconds > max_seconds:
+                    break
+                else:
+                    future = executor.submit(load_audio, path, sampling_rate)
+                pending.append((path, future, next_seconds))
+                pending_seconds += next_seconds
+                next_index += 1
+                next_seconds = None
+
+        try:
+            schedule()
+            while pending:
+                path, future, seconds = pending.popleft()
+                try:
+                    audio = future.result() if future is not None else None
+                    error = None
+                except Exception as e:
+                    audio, error = None, e
+                pending_seconds -= seconds
+
+                # Start the next decode before handing this file to the caller
+                schedule()
+                yield path, audio, error
+                # Drop our reference before blocking on the next decode
+                audio = None
+        finally:
+            for _, future, _ in pending:
+                if future is not None:
+                    future.cancel()
@@ -27,6 +27,32 @@ DOWNLOAD_DIR = "./downloads"
 # False = full video file (default)
 AUDIO_ONLY = False
 
+# ASR download profile (takes precedence over AUDIO_ONLY)
+# True = smallest adequate audio-only stream, stored as 16 kHz mono Opus
+#        (Whisper only uses 16 kHz mono; no video stream, no merge step)
+# False = use AUDIO_ONLY setting (default)
+ASR_PROFILE = False
+
+# Minimum source audio bitrate (kbps) accepted by the ASR profile
+ASR_MIN_ABR = 32
+
+# Bitrate (kbps) of the stored 16 kHz mono Opus file
+ASR_OPUS_BITRATE = 24
+
+# Incremental playlist sync
+# True = list playlists flat, diff against a local metadata cache and only
+#        resolve/download entries that are new or changed since the last run
+# False = fully re-extract and download every URL on every run (default)
+METADATA_SYNC = False
+
+# Metadata cache file (playlist listings and resolved entries)
+# A relative path is placed inside the download directory, so each
+# download directory keeps its own record of what it already holds
+METADATA_CACHE_FILE = ".metadata_cache.json"
+
+# Seconds before a cached playlist listing is fetched again
+METADATA_CACHE_TTL = 6 * 3600
+
 # =============================================================================
 # Transcription Settings
 # =============================================================================
@@ -40,6 +66,59 @@ OUTPUT_FORMAT = "vtt"
 # Or specify language code: "en", "ja", "es", "fr", etc.
 LANGUAGE = None
 
+# Number of files decoded in the background while the current file is
+# transcribed (faster-whisper only). 0 = decode each file when it is reached
+PREFETCH_FILES = 2
+
+# Maximum decoded audio (seconds) waiting in the prefetch queue
+# 16 kHz float32 audio takes ~230 MB per hour
+PREFETCH_MAX_SECONDS = 2 * 3600
+
+# Files longer than this (seconds) are decoded and transcribed window by window
+# so memory stays flat regardless of length (faster-whisper only).
+# Files of unknown length are windowed too. None = always decode whole files
+WINDOWED_MIN_SECONDS = 3600
+
+# Window length (seconds) for windowed decoding
+WINDOW_SECONDS = 600
+
+# Two-pass decoding (faster-whisper only)
+# True = decode greedily, then re-decode only low-confidence segments with beam search
+# False = beam search for every segment (default)
+TWO_PASS = False
+
+# Beam size used to re-decode segments that fail the thresholds below
+TWO_PASS_BEAM_SIZE = 5
+
+# A greedy segment is re-decoded if any of these is exceeded:
+# avg_logprob below, compression_ratio above, no_speech_prob above
+TWO_PASS_LOGPROB_THRESHOLD = -0.5
+TWO_PASS_COMPRESSION_RATIO_THRESHOLD = 2.0
+TWO_PASS_NO_SPEECH_THRESHOLD = 0.5
+
+# Repetition-loop guard (faster-whisper only)
+# True = abort decoding loops (the same phrase repeated over music/silence),
+#        drop the repeated segments and resume at the next speech region
+# False = keep every decoded segment (default)
+LOOP_GUARD = False
+
+# Number of recent segments examined (and held back) by the detector
+LOOP_GUARD_WINDOW_SEGMENTS = 8
+
+# Identical consecutive segments that count as a loop
+LOOP_GUARD_MIN_REPEATS = 3
+
+# Texts shorter than this need proportionally more identical repeats
+# (e.g. "Yeah." needs 9, "♪" needs 36), so a few backchannels in a row are
+# kept while long runs of short filler are still caught
+LOOP_GUARD_MIN_REPEAT_CHARS = 12
+
+# A window also counts as a loop if more than this share of its word
+# n-grams are repeats, or its text compresses better than the ratio below
+LOOP_GUARD_NGRAM_SIZE = 3
+LOOP_GUARD_NGRAM_REPEAT_RATIO = 0.5
+LOOP_GUARD_COMPRESSION_RATIO = 2.4
+
 # =============================================================================
 # Post-Processing Settings
 # =============================================================================
@@ -48,3 +127,25 @@ LANGUAGE = None
 # True = delete after transcription
 # False = keep files (default)
 DELETE_AFTER_TRANSCRIPTION = False
+
+# =============================================================================
+# Duplicate Detection Settings
+# =============================================================================
+
+# Skip transcription of re-uploads / re-encodes of already transcribed audio
+# True = fingerprint each file and reuse the transcript of a near-duplicate
+# False = transcribe every file (default)
+DEDUP_ENABLED = False
+
+# Fingerprint index (stores fingerprints and transcripts of processed files)
+# A relative path is placed inside the directory being transcribed
+DEDUP_INDEX_FILE = ".fingerprints.json"
+
+# Fraction of fingerprint hashes that must align for two files to match
+# Re-encodes typically score 0.3-1.0, unrelated audio stays below 0.01
+DEDUP_SIMILARITY_THRESHOLD = 0.15
+
+# Fraction of a file the matched recording must cover (after alignment) for
+# its transcript to be reused. Files that only partly overlap an indexed one
+# are transcribed in full, so no new speech is lost
+DEDUP_MIN_COVERAGE = 0.95
@@ -0,0 +1,637 @@
+#!/usr/bin/env python3
+"""
+Decoding strategies layered on top of faster-whisper's model.transcribe.
+"""
+
+import json
+import math
+import time
+import zlib
+from dataclasses import replace
+
+import numpy as np
+from faster_whisper.vad import VadOptions, get_speech_timestamps
+
+from audio_loader import SAMPLING_RATE, iter_audio_blocks
+from tracing import span, traced
+
+# Default window length for windowed decoding (10 minutes ~ 38 MB of float32 audio)
+DEFAULT_WINDOW_SECONDS = 600
+
+# Whisper encodes audio in 30 second windows; decoding cost scales with their count
+WHISPER_WINDOW_SECONDS = 30
+
+
+def shift_segment(segment, offset: float):
+    """Return a copy of a faster-whisper Segment with timestamps moved by offset seconds."""
+    if offset == 0:
+        return segment
+    words = segment.words
+    if words:
+        words = [replace(w, start=w.start + offset, end=w.end + offset) for w in words]
+    return replace(segment, start=segment.start + offset, end=segment.end + offset, words=words)
+
+
+def transcribe_windowed(transcribe, path: str, window_seconds: float = DEFAULT_WINDOW_SECONDS, **options):
+    """
+    Transcribe a media file window by window instead of decoding it whole.
+
+    Each window is transcribed separately and its segments are shifted to
+    absolute time. The last segment of a window may be cut off at the window
+    edge, so it is held back and its audio is carried into the next window.
+    The text of the last kept segment is passed on as initial_prompt so
+    conditioning continues across windows, and the language detected on
+    the first window is reused for the rest.
+
+    Args:
+        transcribe: model.transcribe, or a strategy with the same signature
+        path: Media file path
+        window_seconds: Length of each decoded block
+        **options: Passed to transcribe. If clip_start is among them, each
+            call gets the absolute start (seconds) of its window instead
+
+    Returns:
+        Tuple of (segments, info) like model.transcribe. info comes from the
+        first window.
+    """
+    blocks = traced(iter_audio_blocks(path, window_seconds), "decode block", "audio")
+    first = next(blocks, None)
+    if first is None:
+        raise ValueError(f"No audio decoded from '{path}'")
+
+    segments, info = transcribe(first, **options)
+    options = dict(options, language=info.language)
+
+    def generate(window, segments):
+        window_start = 0  # Absolute position of window[0], in samples
+        upcoming = next(blocks, None)
+        last_text = None
+
+        while True:
+            offset = window_start / SAMPLING_RATE
+            held = None
+            for segment in segments:
+                if held is not None:
+                    last_text = held.text
+                    yield shift_segment(held, offset)
+                held = segment
+
+            if upcoming is None:
+                if held is not None:
+                    yield shift_segment(held, offset)
+                return
+
+            # Carry audio from the start of the held-back segment into the next
+            # window, unless that would stall progress through the file.
+            carry_from = len(window)
+            if held is not None:
+                held_start = int(held.start * SAMPLING_RATE)
+                if held_start > len(window) // 2:
+                    carry_from = held_start
+                else:
+                    last_text = held.text
+                    yield shift_segment(held, offset)
+
+            window_start += carry_from
+            window = np.concatenate([window[carry_from:], upcoming])
+            upcoming = next(blocks, None)
+
+            window_options = options
+            if "clip_start" in options:
+                window_options = dict(window_options, clip_start=window_start / SAMPLING_RATE)
+            if last_text and options.get("condition_on_previous_text", True):
+                window_options = dict(window_options, initial_prompt=last_text.strip())
+            segments, _ = transcribe(window, **window_options)
+
+    return generate(first, segments), info
+
+
+def new_two_pass_stats() -> dict:
+    """Counters filled in by transcribe_two_pass."""
+    return {
+        "segments": 0,
+        "redecoded": 0,
+        "audio_seconds": 0.0,
+        "greedy_seconds": 0.0,
+        "beam_seconds": 0.0,
+        "beam_windows": 0,
+    }
+
+
+def add_two_pass_stats(total: dict, stats: dict):
+    """Accumulate stats into total."""
+    for key, value in stats.items():
+        total[key] += value
+
+
+def format_two_pass_stats(stats: dict) -> str:
+    """
+    Summarise two-pass counters.
+
+    The beam-only time is estimated from the measured cost of the beam
+    re-decodes per 30 second Whisper window, extrapolated to the whole audio.
+    Re-decoded regions are the hard ones, where temperature fallback kicks in
+    most, so this overstates the cost of clean audio and the speedup is an
+    upper bound.
+    """
+    share = stats["redecoded"] / stats["segments"] if stats["segments"] else 0.0
+    summary = f"re-decoded {stats['redecoded']}/{stats['segments']} segments ({share:.1%})"
+
+    actual = stats["greedy_seconds"] + stats["beam_seconds"]
+    if stats["beam_windows"] and actual > 0:
+        per_window = stats["beam_seconds"] / stats["beam_windows"]
+        beam_only = per_window * math.ceil(stats["audio_seconds"] / WHISPER_WINDOW_SECONDS)
+        summary += f", speedup vs beam-only: at most {beam_only / actual:.2f}x (estimated)"
+    else:
+        summary += ", speedup vs beam-only: n/a (nothing re-decoded)"
+    return summary
+
+
+def transcribe_two_pass(
+    model,
+    audio,
+    stats: dict = None,
+    beam_size: int = 5,
+    logprob_threshold: float = -0.5,
+    compression_ratio_threshold: float = 2.0,
+    no_speech_threshold: float = 0.5,
+    **options
+):
+    """
+    Decode greedily, then re-decode only low-confidence segments with beam search.
+
+    A segment fails if its avg_logprob is below logprob_threshold, its
+    compression_ratio is above compression_ratio_threshold, or its
+    no_speech_prob is above no_speech_threshold. Consecutive failing
+    segments are merged into one region, re-decoded with beam search on
+    that slice of audio, and the results take their place in the output.
+
+    Args:
+        model: faster-whisper WhisperModel
+        audio: 16 kHz mono float32 array
+        stats: Dict from new_two_pass_stats() to update, optional
+        beam_size: Beam size for the second pass
+        logprob_threshold: Minimum acceptable avg_logprob
+        compression_ratio_threshold: Maximum acceptable compression_ratio
+        no_speech_threshold: Maximum acceptable no_speech_prob
+        **options: Passed to model.transcribe for both passes
+
+    Returns:
+        Tuple of (segments, info) like model.transcribe
+    """
+    stats = stats if stats is not None else new_two_pass_stats()
+
+    greedy_options = dict(options, beam_size=1, best_of=1, temperature=0.0)
+    started = time.perf_counter()
+    greedy, info = model.transcribe(audio, **greedy_options)
+    stats["greedy_seconds"] += time.perf_counter() - started
+    stats["audio_seconds"] += len(audio) / SAMPLING_RATE
+
+    beam_options = dict(options, beam_size=beam_size, language=info.language)
+
+    def failed(segment) -> bool:
+        return (
+            segment.avg_logprob < logprob_threshold
+            or segment.compression_ratio > compression_ratio_threshold
+            or segment.no_speech_prob > no_speech_threshold
+        )
+
+    def redecode(region, prompt):
+        start = region[0].start
+        end = region[-1].end
+        region_options = beam_options
+        if prompt and options.get("condition_on_previous_text", True):
+            region_options = dict(beam_options, initial_prompt=prompt.strip())
+
+        started = time.perf_counter()
+        with span("beam re-decode", "inference", segments=len(region)):
+            clip = audio[int(start * SAMPLING_RATE):int(end * SAMPLING_RATE)]
+            segments, _ = model.transcribe(clip, **region_options)
+            segments = [shift_segment(segment, start) for segment in segments]
+        stats["beam_seconds"] += time.perf_counter() - started
+        stats["beam_windows"] += math.ceil((end - start) / WHISPER_WINDOW_SECONDS)
+        stats["redecoded"] += len(region)
+        return segments
+
+    def generate():
+        region = []
+        prompt = None
+        iterator = iter(greedy)
+        while True:
+            started = time.perf_counter()
+            segment = next(iterator, None)
+            stats["greedy_seconds"] += time.perf_counter() - started
+            if segment is None:
+                break
+
+            stats["segments"] += 1
+            if failed(segment):
+                region.append(segment)
+                continue
+
+            if region:
+                yield from redecode(region, prompt)
+                region = []
+            prompt = segment.text
+            yield segment
+
+        if region:
+            yield from redecode(region, prompt)
+
+    return generate(), info
+
+
+# Decoding settings from most to least expensive. Options not listed here
+# keep faster-whisper's defaults (beam_size=5, six fallback temperatures).
+QUALITY_TIERS = [
+    {"name": "beam5", "beam_size": 5, "best_of": 5, "temperature": [0.0, 0.2, 0.4, 0.6, 0.8, 1.0]},
+    {"name": "beam3", "beam_size": 3, "best_of": 3, "temperature": [0.0, 0.2, 0.4, 0.6, 0.8, 1.0]},
+    {"name": "beam3-fallback3", "beam_size": 3, "best_of": 3, "temperature": [0.0, 0.5, 1.0]},
+    {"name": "greedy", "beam_size": 1, "best_of": 1, "temperature": 0.0},
+]
+
+
+class RtfController:
+    """
+    Tracks compute time against audio progress for one file and steps
+    decoding down through QUALITY_TIERS while it is behind a real-time-factor
+    target (compute seconds per audio second).
+    """
+
+    def __init__(self, target_rtf: float, check_seconds: float = 30.0, tiers: list = None):
+        self.target_rtf = target_rtf
+        self.check_seconds = check_seconds
+        self.tiers = tiers if tiers is not None else QUALITY_TIERS
+        self.tier = 0
+        self.started = time.perf_counter()
+        self.last_check = 0.0
+        self.progress = 0.0
+        self.ranges = []
+
+    @property
+    def tier_name(self) -> str:
+        return self.tiers[self.tier]["name"]
+
+    def tier_options(self) -> dict:
+        """Decoding options for the current tier."""
+        return {key: value for key, value in self.tiers[self.tier].items() if key != "name"}
+
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.started
+
+    def should_step_down(self, progress: float) -> bool:
+        """
+        Decide whether to switch to a cheaper tier.
+
+        Checked at most once per check_seconds of audio, so a new tier gets
+        a chance to catch up before the next step.
+        """
+        self.progress = max(self.progress, progress)
+        if self.tier == len(self.tiers) - 1 or progress - self.last_check < self.check_seconds:
+            return False
+        self.last_check = progress
+        return self.elapsed() > self.target_rtf * progress
+
+    def step_down(self):
+        self.tier += 1
+        print(f"Behind RTF target {self.target_rtf} at {self.progress:.0f}s "
+              f"(elapsed {self.elapsed():.0f}s), switching to tier '{self.tier_name}'")
+
+    def record(self, start: float, end: float):
+        """Attribute an emitted segment (absolute times) to the current tier."""
+        self.progress = max(self.progress, end)
+        if self.ranges and self.ranges[-1]["tier"] == self.tier_name:
+            self.ranges[-1]["end"] = end
+        else:
+            self.ranges.append({"tier": self.tier_name, "start": start, "end": end})
+
+    def summary(self) -> dict:
+        """Quality record for the file's output."""
+        elapsed = self.elapsed()
+        return {
+            "target_rtf": self.target_rtf,
+            "achieved_rtf": elapsed / self.progress if self.progress else None,
+            "elapsed_seconds": elapsed,
+            "final_tier": self.tier_name,
+            "tiers_used": list(dict.fromkeys(r["tier"] for r in self.ranges)),
+            "ranges": self.ranges,
+        }
+
+
+def save_quality_record(path: str, controller: RtfController):
+    """Write the controller's quality record as JSON."""
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(controller.summary(), f, indent=2)
+
+
+def transcribe_adaptive(model, audio, controller: RtfController, clip_start: float = 0.0, **options):
+    """
+    Transcribe while keeping to a real-time-factor target.
+
+    After each segment the controller compares elapsed compute with audio
+    progress. When it is behind, the current decode is abandoned after that
+    segment and decoding restarts from the segment's end with the next
+    cheaper tier (smaller beam, fewer fallback temperatures, then greedy).
+    The controller is shared across calls, so windowed decoding keeps one
+    budget for the whole file; progress is measured in absolute file time,
+    so audio that is carried over or skipped between calls is not
+    double-counted or lost.
+
+    Args:
+        model: faster-whisper WhisperModel
+        audio: 16 kHz mono float32 array
+        controller: RtfController for this file
+        clip_start: Position (seconds) of audio[0] within the file
+        **options: Passed to model.transcribe (tier options take precedence)
+
+    Returns:
+        Tuple of (segments, info) like model.transcribe
+    """
+    duration = len(audio) / SAMPLING_RATE
+    segments, info = model.transcribe(audio, **dict(options, **controller.tier_options()))
+    options = dict(options, language=info.language)
+
+    def generate(segments):
+        offset = 0.0
+        while True:
+            resume = None
+            for segment in segments:
+                segment = shift_segment(segment, offset)
+                yield segment
+
+                if segment.end < duration - 1.0 and \
+                        controller.should_step_down(clip_start + segment.end):
+                    controller.step_down()
+                    resume = segment.end
+                    prompt = segment.text
+                    break
+
+            if resume is None:
+                break
+
+            if hasattr(segments, "close"):
+                segments.close()
+            tier_options = dict(options, **controller.tier_options())
+            if options.get("condition_on_previous_text", True):
+                tier_options["initial_prompt"] = prompt.strip()
+            with span("tier restart", "inference", tier=controller.tier_name):
+                segments, _ = model.transcribe(audio[int(resume * SAMPLING_RATE):], **tier_options)
+            offset = resume
+
+    return generate(segments), info
+
+
+def new_loop_guard_stats() -> dict:
+    """Counters filled in by transcribe_loop_guarded."""
+    return {
+        "loops": 0,
+        "dropped_segments": 0,
+        "skipped_seconds": 0.0,
+        "saved_compute_seconds": 0.0,
+    }
+
+
+def add_loop_guard_stats(total: dict, stats: dict):
+    """Accumulate stats into total."""
+    for key, value in stats.items():
+        total[key] += value
+
+
+def format_loop_guard_stats(stats: dict) -> str:
+    """Summarise loop guard counters."""
+    return (
+        f"{stats['loops']} loop(s) aborted, {stats['dropped_segments']} segment(s) dropped, "
+        f"{stats['skipped_seconds']:.1f}s of audio skipped, "
+        f"~{stats['saved_compute_seconds']:.1f}s of compute saved"
+    )
+
+
+def _normalize(text: str) -> str:
+    return " ".join(text.lower().split())
+
+
+def _tokens(text: str) -> list:
+    """Words for space-delimited languages, characters otherwise (e.g. Japanese)."""
+    words = text.split()
+    if len(words) * 10 >= len(text):
+        return words
+    return [c for c in text if not c.isspace()]
+
+
+def _ngrams(text: str, n: int) -> list:
+    tokens = _tokens(_normalize(text))
+    return [tuple(tokens[i:i + n]) for i in range(len(tokens) - n + 1)]
+
+
+def _compression_ratio(text: str) -> float:
+    """Same measure Whisper uses for its temperature fallback."""
+    data = text.encode("utf-8")
+    return len(data) / len(zlib.compress(data)) if data else 0.0
+
+
+def required_repeats(text: str, min_repeats: int = 3, min_repeat_chars: int = 12) -> int:
+    """
+    Identical consecutive segments of this text that count as a loop.
+
+    Texts shorter than min_repeat_chars need proportionally more repeats, so
+    a few backchannels ("Yeah.", "Okay.") in a row are not a loop while a
+    long run of "♪" or "[Music]" still is.
+    """
+    return min_repeats * max(1, math.ceil(min_repeat_chars / max(len(text), 1)))
+
+
+def detect_loop(
+    segments: list,
+    window_segments: int = 8,
+    min_repeats: int = 3,
+    min_repeat_chars: int = 12,
+    ngram_size: int = 3,
+    ngram_repeat_ratio: float = 0.5,
+    compression_ratio: float = 2.4,
+    repeat_run: int = None
+) -> bool:
+    """
+    Decide whether the most recent segments look like a repetition loop.
+
+    Trips when the last segments have identical text at least
+    required_repeats times in a row, or, once window_segments segments are
+    available, when the window's n-grams are mostly repeats or its text
+    compresses better than compression_ratio.
+
+    repeat_run is the length of the identical run ending at the last segment
+    when the caller tracks it beyond the segments passed in; by default the
+    run is counted within segments.
+    """
+    texts = [_normalize(s.text) for s in segments[-window_segments:]]
+    last = texts[-1] if texts else ""
+
+    if repeat_run is None:
+        repeat_run = 0
+        for segment in reversed(segments):
+            if _normalize(segment.text) != last:
+                break
+            repeat_run += 1
+    if last and repeat_run >= required_repeats(last, min_repeats, min_repeat_chars):
+        return True
+
+    if len(texts) < window_segments:
+        return False
+
+    joined = " ".join(texts)
+    ngrams = _ngrams(joined, ngram_size)
+    if len(ngrams) >= 4 * ngram_size and 1 - len(set(ngrams)) / len(ngrams) > ngram_repeat_ratio:
+        return True
+
+    return len(joined) >= 200 and _compression_ratio(joined) > compression_ratio
+
+
+def _split_loop(segments: list, loop_text: str, min_repeat_chars: int, ngram_size: int,
+                ngram_repeat_ratio: float, compression_ratio: float):
+    """
+    Split buffered segments into (kept, dropped); dropped ones repeat earlier text.
+
+    Short texts are only dropped for being identical to an earlier segment if
+    they are the text that tripped the detector (loop_text), so backchannels
+    elsewhere in the buffer survive.
+    """
+    kept = []
+    dropped = []
+    seen_texts = set()
+    seen_ngrams = set()
+
+    for segment in segments:
+        text = _normalize(segment.text)
+        ngrams = _ngrams(text, ngram_size)
+        repeated = (
+            (text in seen_texts and (len(text) >= min_repeat_chars or text == loop_text))
+            or (ngrams and sum(g in seen_ngrams for g in ngrams) / len(ngrams) > ngram_repeat_ratio)
+            or segment.compression_ratio > compression_ratio
+        )
+        (dropped if repeated else kept).append(segment)
+        seen_texts.add(text)
+        seen_ngrams.update(ngrams)
+
+    return kept, dropped
+
+
+def next_speech_start(audio, position: float, chunk_seconds: float = 120):
+    """
+    Find where speech resumes at or after position (seconds) using Silero VAD.
+
+    Audio is scanned in chunks so a long non-speech tail is not analysed all
+    at once. Returns None if there is no more speech.
+    """
+    chunk = int(chunk_seconds * SAMPLING_RATE)
+    sample = int(position * SAMPLING_RATE)
+    while sample < len(audio):
+        speech = get_speech_timestamps(audio[sample:sample + chunk], VadOptions())
+        if speech:
+            return (sample + speech[0]["start"]) / SAMPLING_RATE
+        sample += chunk
+    return None
+
+
+def transcribe_loop_guarded(
+    transcribe,
+    audio,
+    stats: dict = None,
+    window_segments: int = 8,
+    min_repeats: int = 3,
+    min_repeat_chars: int = 12,
+    ngram_size: int = 3,
+    ngram_repeat_ratio: float = 0.5,
+    compression_ratio: float = 2.4,
+    **options
+):
+    """
+    Abort repetition/hallucination loops while streaming segments.
+
+    Segments pass through a buffer of window_segments so that a loop can be
+    removed before it is emitted. When detect_loop trips, the current decode
+    is abandoned. Buffered segments that repeat earlier text are dropped, and
+    decoding restarts at the next VAD speech region after the loop. The
+    restart is a fresh transcribe call, so the conditioning prompt is reset.
+
+    Args:
+        transcribe: model.transcribe, or a strategy with the same signature
+        audio: 16 kHz mono float32 array
+        stats: Dict from new_loop_guard_stats() to update, optional
+        window_segments: Segments examined (and buffered) by the detector
+        min_repeats: Identical consecutive segments that count as a loop
+        min_repeat_chars: Texts shorter than this need proportionally more
+            repeats (see required_repeats)
+        ngram_size: Token n-gram length for the repetition measure
+        ngram_repeat_ratio: Share of repeated n-grams that counts as a loop
+        compression_ratio: zlib compression ratio of the window that counts as a loop
+        **options: Passed to transcribe. If clip_start is among them, a restart
+            gets the absolute position of the audio it resumes from
+
+    Returns:
+        Tuple of (segments, info) like model.transcribe
+    """
+    stats = stats if stats is not None else new_loop_guard_stats()
+    duration = len(audio) / SAMPLING_RATE
+    started = time.perf_counter()
+
+    segments, info = transcribe(audio, **options)
+    options = dict(options, language=info.language)
+    options.pop("initial_prompt", None)
+
+    def generate(segments):
+        offset = 0.0
+        while True:
+            buffer = []
+            tripped = False
+            # Identical-text run, counted past the buffer so short texts that
+            # need many repeats are still caught
+            run_text = None
+            run_length = 0
+            for segment in segments:
+                buffer.append(shift_segment(segment, offset))
+                text = _normalize(segment.text)
+                run_length = run_length + 1 if text == run_text else 1
+                run_text = text
+                if detect_loop(buffer, window_segments, min_repeats, min_repeat_chars,
+                               ngram_size, ngram_repeat_ratio, compression_ratio, run_length):
+                    tripped = True
+                    break
+                if len(buffer) > window_segments:
+                    yield buffer.pop(0)
+
+            if not tripped:
+                yield from buffer
+                return
+
+            if hasattr(segments, "close"):
+                segments.close()
+
+            kept, dropped = _split_loop(buffer, run_text, min_repeat_chars, ngram_size,
+                                        ngram_repeat_ratio, compression_ratio)
+            yield from kept
+
+            loop_end = buffer[-1].end
+            with span("find speech", "vad"):
+                resume = next_speech_start(audio, loop_end)
+            skipped = (resume if resume is not None else duration) - loop_end
+            compute_rate = (time.perf_counter() - started) / max(loop_end, 1.0)
+
+            stats["loops"] += 1
+            stats["dropped_segments"] += len(dropped)
+            stats["skipped_seconds"] += skipped
+            stats["saved_compute_seconds"] += skipped * compute_rate
+
+            where = f"{dropped[0].start:.1f}s" if dropped else f"{loop_end:.1f}s"
+            print(f"Repetition loop at {where}: dropped {len(dropped)} segment(s), "
+                  f"skipping {skipped:.1f}s of non-speech "
+                  f"(~{skipped * compute_rate:.1f}s of compute saved)")
+
+            if resume is None:
+                return
+
+            restart_options = options
+            if "clip_start" in options:
+                restart_options = dict(options, clip_start=options["clip_start"] + resume)
+            segments, _ = transcribe(audio[int(resume * SAMPLING_RATE):], **restart_options)
+            offset = resume
+
+    return generate(segments), info
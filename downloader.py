@@ -4,12 +4,26 @@ YouTube video downloader using yt-dlp.
 Supports single videos and playlists.
 """
 
+import json
 import os
+import time
+
 import yt_dlp
-from config import YOUTUBE_URLS, DOWNLOAD_DIR, AUDIO_ONLY
+from config import (
+    YOUTUBE_URLS,
+    DOWNLOAD_DIR,
+    AUDIO_ONLY,
+    ASR_PROFILE,
+    ASR_MIN_ABR,
+    ASR_OPUS_BITRATE,
+    METADATA_SYNC,
+    METADATA_CACHE_FILE,
+    METADATA_CACHE_TTL,
+)
+from tracing import begin, end, span, tracing_enabled
 
 
-def get_ydl_opts(output_dir: str, audio_only: bool) -> dict:
+def get_ydl_opts(output_dir: str, audio_only: bool, asr_profile: bool = False) -> dict:
     """Get yt-dlp options based on configuration."""
     opts = {
         "outtmpl": os.path.join(output_dir, "%(title)s [%(id)s].%(ext)s"),
@@ -21,7 +35,32 @@ def get_ydl_opts(output_dir: str, audio_only: bool) -> dict:
         "remote_components": {"ejs:github"},
     }
 
-    if audio_only:
+    if asr_profile:
+        # Smallest audio-only stream that is still good enough for speech,
+        # preferring Opus. Never selects a video stream, so nothing is merged.
+        # "lang" sorts first so the original track wins over auto-dubbed ones;
+        # "+abr" then makes "best" mean the lowest adequate bitrate.
+        opts.update({
+            "format": f"bestaudio[abr>={ASR_MIN_ABR}]/bestaudio/best",
+            "format_sort": ["lang", "+abr", "acodec:opus"],
+            "postprocessors": [{
+                "key": "FFmpegExtractAudio",
+                "preferredcodec": "opus",
+                "preferredquality": str(ASR_OPUS_BITRATE),
+            }],
+            # Always re-encode: for an Opus source yt-dlp would otherwise
+            # stream-copy the 48 kHz stereo track and ignore the bitrate.
+            # These output args come after its own "-acodec copy", so they win.
+            "postprocessor_args": {
+                "extractaudio+ffmpeg_o": [
+                    "-c:a", "libopus",
+                    "-b:a", f"{ASR_OPUS_BITRATE}k",
+                    "-ar", "16000",
+                    "-ac", "1",
+                ],
+            },
+        })
+    elif audio_only:
         opts.update({
             "format": "bestaudio/best",
             "postprocessors": [{
@@ -39,7 +78,138 @@ def get_ydl_opts(output_dir: str, audio_only: bool) -> dict:
     return opts
 
 
-def download_videos(urls: list = None, output_dir: str = None, audio_only: bool = None) -> list:
+def load_metadata_cache(path: str) -> dict:
+    """Load the playlist metadata cache, or return an empty one."""
+    if os.path.exists(path):
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    return {"version": 1, "playlists": {}, "entries": {}}
+
+
+def save_metadata_cache(path: str, cache: dict):
+    """Write the playlist metadata cache."""
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(cache, f, indent=2, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+
+def summarize_entry(info: dict) -> dict:
+    """Keep the fields of a yt-dlp info dict that the cache tracks."""
+    return {
+        "id": info.get("id"),
+        "title": info.get("title"),
+        "duration": info.get("duration"),
+        "upload_date": info.get("upload_date"),
+        "url": info.get("webpage_url") or info.get("url") or info.get("id"),
+    }
+
+
+def downloaded_filepath(info: dict):
+    """
+    Return the final file of a yt-dlp download if it exists on disk.
+
+    With ignoreerrors, extract_info still returns the info dict when the
+    download or post-processing failed, so the file has to be checked.
+    """
+    if not info:
+        return None
+    paths = [d.get("filepath") for d in info.get("requested_downloads") or []]
+    paths.append(info.get("filepath"))
+    for path in paths:
+        if path and os.path.exists(path):
+            return path
+    return None
+
+
+def flatten_entries(info: dict) -> list:
+    """
+    List the videos in a flat (extract_flat) yt-dlp result.
+
+    Playlists may nest (e.g. channel tabs); a plain video yields itself.
+    """
+    if info is None:
+        return []
+    if info.get("_type") in ("playlist", "multi_video"):
+        entries = []
+        for entry in info.get("entries") or []:
+            entries.extend(flatten_entries(entry))
+        return entries
+    if not info.get("id"):
+        return []
+    return [summarize_entry(info)]
+
+
+def diff_entries(listed: list, resolved: dict) -> list:
+    """
+    Select listed entries that need a full resolve.
+
+    An entry is new if it has never been resolved, and changed if the
+    listing reports a different title or duration than the cached one
+    (fields missing from the flat listing are not compared).
+
+    Args:
+        listed: Entries from the flat listing
+        resolved: Cached fully-resolved entries, keyed by id
+
+    Returns:
+        Listed entries that are new or changed, in listing order
+    """
+    pending = []
+    for entry in listed:
+        cached = resolved.get(entry["id"])
+        if cached is None:
+            pending.append(entry)
+            continue
+        for field in ("title", "duration"):
+            if entry.get(field) is not None and cached.get(field) is not None \
+                    and entry[field] != cached[field]:
+                pending.append(entry)
+                break
+    return pending
+
+
+def sync_playlist(url: str, cache: dict, extract, ttl: float, now: float = None) -> list:
+    """
+    Diff a playlist (or video) URL against the metadata cache.
+
+    The flat listing is only re-fetched once the cached one is older than
+    ttl seconds; otherwise the cached listing is diffed again, so entries
+    that failed to download last time are retried.
+
+    Args:
+        url: Playlist or video URL
+        cache: Cache from load_metadata_cache (updated in place)
+        extract: Callable returning the flat yt-dlp info dict for a URL
+        ttl: Maximum age of a cached listing in seconds
+        now: Current time (defaults to time.time())
+
+    Returns:
+        Entries that are new or changed and need a full resolve
+    """
+    now = now if now is not None else time.time()
+    listing = cache["playlists"].get(url)
+
+    if listing is None or now - listing["listed_at"] >= ttl:
+        info = extract(url)
+        if info is None:
+            return []
+        listing = {"listed_at": now, "entries": flatten_entries(info)}
+        cache["playlists"][url] = listing
+
+    return diff_entries(listing["entries"], cache["entries"])
+
+
+def download_videos(
+    urls: list = None,
+    output_dir: str = None,
+    audio_only: bool = None,
+    asr_profile: bool = None,
+    sync: bool = None
+) -> list:
     """
     Download videos from YouTube URLs.
 
@@ -47,6 +217,10 @@ def download_videos(urls: list = None, output_dir: str = None, audio_only: bool
         urls: List of YouTube URLs (videos or playlists). Defaults to config.YOUTUBE_URLS
         output_dir: Output directory. Defaults to config.DOWNLOAD_DIR
         audio_only: Download audio only. Defaults to config.AUDIO_ONLY
+        asr_profile: Download 16 kHz mono audio for transcription. Defaults to config.ASR_PROFILE
+        sync: Only resolve and download entries that are new or changed since the
+            last run into output_dir, using the metadata cache kept there.
+            Defaults to config.METADATA_SYNC
 
     Returns:
         List of downloaded file paths
@@ -54,6 +228,8 @@ def download_videos(urls: list = None, output_dir: str = None, audio_only: bool
     urls = urls if urls is not None else YOUTUBE_URLS
     output_dir = output_dir if output_dir is not None else DOWNLOAD_DIR
     audio_only = audio_only if audio_only is not None else AUDIO_ONLY
+    asr_profile = asr_profile if asr_profile is not None else ASR_PROFILE
+    sync = sync if sync is not None else METADATA_SYNC
 
     if not urls:
         print("No URLs specified in config.py")
@@ -73,21 +249,98 @@ def download_videos(urls: list = None, output_dir: str = None, audio_only: bool
             if filepath and filepath not in downloaded_files:
                 downloaded_files.append(filepath)
 
-    opts = get_ydl_opts(output_dir, audio_only)
+    opts = get_ydl_opts(output_dir, audio_only, asr_profile)
     opts["postprocessor_hooks"] = [postprocessor_hook]
 
+    if tracing_enabled():
+        transferring = set()
+
+        def trace_progress_hook(d):
+            """Trace each file transfer."""
+            filename = d.get("filename", "")
+            if d["status"] == "downloading" and filename not in transferring:
+                transferring.add(filename)
+                begin("transfer", "download", file=os.path.basename(filename))
+            elif d["status"] in ("finished", "error") and filename in transferring:
+                transferring.discard(filename)
+                end("transfer", "download")
+
+        def trace_postprocessor_hook(d):
+            """Trace each postprocessor (merge, FFmpeg conversion, ...)."""
+            if d["status"] == "started":
+                begin(d.get("postprocessor", "postprocess"), "postprocess")
+            elif d["status"] == "finished":
+                end(d.get("postprocessor", "postprocess"), "postprocess")
+
+        opts["progress_hooks"] = [trace_progress_hook]
+        opts["postprocessor_hooks"].append(trace_postprocessor_hook)
+
     print(f"Download directory: {os.path.abspath(output_dir)}")
     print(f"Audio only: {audio_only}")
+    print(f"ASR profile: {asr_profile}")
+    print(f"Metadata sync: {sync}")
     print(f"URLs to process: {len(urls)}")
     print("-" * 50)
 
-    with yt_dlp.YoutubeDL(opts) as ydl:
-        for i, url in enumerate(urls, 1):
-            print(f"\n[{i}/{len(urls)}] Processing: {url}")
-            try:
-                ydl.download([url])
-            except Exception as e:
-                print(f"Error downloading {url}: {e}")
+    if sync:
+        cache_file = os.path.join(output_dir, METADATA_CACHE_FILE)
+        cache = load_metadata_cache(cache_file)
+        flat_opts = {"extract_flat": "in_playlist", "ignoreerrors": True, "quiet": True}
+
+        with yt_dlp.YoutubeDL(flat_opts) as flat_ydl, yt_dlp.YoutubeDL(opts) as ydl:
+            for i, url in enumerate(urls, 1):
+                print(f"\n[{i}/{len(urls)}] Syncing: {url}")
+                try:
+                    with span("flat listing", "download", url=url):
+                        pending = sync_playlist(
+                            url,
+                            cache,
+                            lambda u: flat_ydl.extract_info(u, download=False),
+                            METADATA_CACHE_TTL
+                        )
+                except Exception as e:
+                    print(f"Error listing {url}: {e}")
+                    continue
+
+                listed = len(cache["playlists"].get(url, {}).get("entries", []))
+                print(f"Entries: {listed} listed, {len(pending)} new or changed")
+
+                for entry in pending:
+                    try:
+                        with span("yt-dlp", "download", url=entry["url"]):
+                            info = ydl.extract_info(entry["url"], download=True)
+                    except Exception as e:
+                        print(f"Error downloading {entry['url']}: {e}")
+                        continue
+                    filepath = downloaded_filepath(info)
+                    if filepath is None:
+                        print(f"No file downloaded for {entry['url']}, will retry on the next run")
+                        continue
+
+                    # A changed title means a new filename; drop the old copy so
+                    # the same video is not transcribed twice
+                    old_path = cache["entries"].get(entry["id"], {}).get("filepath")
+                    if old_path and old_path != filepath and os.path.exists(old_path):
+                        os.remove(old_path)
+                        print(f"Removed previous download: {old_path}")
+
+                    cache["entries"][entry["id"]] = dict(
+                        summarize_entry(info),
+                        filepath=filepath,
+                        resolved_at=time.time()
+                    )
+                    save_metadata_cache(cache_file, cache)
+
+        save_metadata_cache(cache_file, cache)
+    else:
+        with yt_dlp.YoutubeDL(opts) as ydl:
+            for i, url in enumerate(urls, 1):
+                print(f"\n[{i}/{len(urls)}] Processing: {url}")
+                try:
+                    with span("yt-dlp", "download", url=url):
+                        ydl.download([url])
+                except Exception as e:
+                    print(f"Error downloading {url}: {e}")
 
     print("-" * 50)
     print(f"Download complete. Files downloaded: {len(downloaded_files)}")
@@ -112,7 +365,7 @@ def get_downloaded_files(output_dir: str = None) -> list:
 
     media_extensions = {
         ".mp4", ".mkv", ".webm", ".avi", ".mov",  # Video
-        ".mp3", ".m4a", ".wav", ".flac", ".ogg", ".aac", ".wma"  # Audio
+        ".mp3", ".m4a", ".wav", ".flac", ".ogg", ".opus", ".aac", ".wma"  # Audio
     }
 
     files = []
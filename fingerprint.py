@@ -0,0 +1,279 @@
+#!/usr/bin/env python3
+"""
+Acoustic fingerprinting for duplicate detection.
+Hashes pairs of spectral peaks (landmarks) from 16 kHz mono audio so that
+re-uploads and re-encodes of the same recording can reuse a transcript.
+"""
+
+import base64
+import json
+import os
+
+import numpy as np
+
+SAMPLING_RATE = 16000
+N_FFT = 1024
+HOP_LENGTH = 512
+MAX_BIN = 256  # Ignore content above 4 kHz (lossy codecs mangle it first)
+PEAK_NEIGHBORHOOD = 10  # Peak must be the maximum within +/- this many frames and bins
+PEAK_THRESHOLD = 2.0  # Minimum log-magnitude above the chunk mean
+FAN_OUT = 5  # Number of target peaks paired with each anchor peak
+MAX_DELTA_FRAMES = 63  # Must fit in 6 bits of the hash
+CHUNK_FRAMES = 4096  # Frames processed at once to bound memory
+
+_WINDOW = np.hanning(N_FFT).astype(np.float32)
+
+
+def frames_to_seconds(frames) -> float:
+    """Convert a fingerprint frame index (or offset) to seconds."""
+    return frames * HOP_LENGTH / SAMPLING_RATE
+
+
+def align_block_seconds(seconds: float) -> float:
+    """Round a block length down to a whole number of hops, as fingerprint_blocks requires."""
+    hops = max(1, int(seconds * SAMPLING_RATE) // HOP_LENGTH)
+    return hops * HOP_LENGTH / SAMPLING_RATE
+
+
+def _max_filter(values: np.ndarray, size: int, axis: int) -> np.ndarray:
+    """Sliding maximum of width 2 * size + 1 along one axis."""
+    pad = [(0, 0)] * values.ndim
+    pad[axis] = (size, size)
+    padded = np.pad(values, pad, mode="constant", constant_values=-np.inf)
+    windows = np.lib.stride_tricks.sliding_window_view(padded, 2 * size + 1, axis=axis)
+    return windows.max(axis=-1)
+
+
+def _find_peaks(audio: np.ndarray) -> tuple:
+    """Return (frames, bins) of spectral peaks, sorted by time."""
+    n_frames = 1 + (len(audio) - N_FFT) // HOP_LENGTH
+    if n_frames <= 0:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+
+    all_frames = np.lib.stride_tricks.sliding_window_view(audio, N_FFT)[::HOP_LENGTH]
+    peak_frames = []
+    peak_bins = []
+
+    for start in range(0, n_frames, CHUNK_FRAMES):
+        # Extend each chunk so peaks near its edges see their full neighbourhood
+        lo = max(0, start - PEAK_NEIGHBORHOOD)
+        hi = min(n_frames, start + CHUNK_FRAMES + PEAK_NEIGHBORHOOD)
+
+        spectrum = np.abs(np.fft.rfft(all_frames[lo:hi] * _WINDOW, axis=1))[:, :MAX_BIN]
+        spectrum = np.log(spectrum + 1e-6).astype(np.float32)
+
+        local_max = _max_filter(spectrum, PEAK_NEIGHBORHOOD, axis=0)
+        local_max = _max_filter(local_max, PEAK_NEIGHBORHOOD, axis=1)
+        is_peak = (spectrum == local_max) & (spectrum > spectrum.mean() + PEAK_THRESHOLD)
+
+        frames, bins = np.nonzero(is_peak)
+        frames = frames + lo
+        keep = (frames >= start) & (frames < start + CHUNK_FRAMES)
+        peak_frames.append(frames[keep])
+        peak_bins.append(bins[keep])
+
+    return np.concatenate(peak_frames), np.concatenate(peak_bins)
+
+
+def compute_fingerprint(audio: np.ndarray, frame_offset: int = 0) -> tuple:
+    """
+    Compute landmark hashes for 16 kHz mono float32 audio.
+
+    Args:
+        audio: Decoded audio samples
+        frame_offset: Added to every frame index (for audio decoded in blocks)
+
+    Returns:
+        Tuple of (hashes, frames) int64 arrays of equal length
+    """
+    frames, bins = _find_peaks(audio)
+
+    hashes = []
+    anchors = []
+    for k in range(1, FAN_OUT + 1):
+        if len(frames) <= k:
+            break
+        delta = frames[k:] - frames[:-k]
+        valid = (delta > 0) & (delta <= MAX_DELTA_FRAMES)
+        hashes.append((bins[:-k][valid] << 16) | (bins[k:][valid] << 6) | delta[valid])
+        anchors.append(frames[:-k][valid])
+
+    if not hashes:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+
+    return (
+        np.concatenate(hashes).astype(np.int64),
+        np.concatenate(anchors).astype(np.int64) + frame_offset,
+    )
+
+
+def fingerprint_blocks(blocks) -> tuple:
+    """
+    Compute a fingerprint from audio decoded in consecutive blocks.
+
+    Args:
+        blocks: Iterable of audio arrays; every block but the last must be a
+            multiple of HOP_LENGTH samples long so frame indices line up
+            (see align_block_seconds)
+
+    Returns:
+        Tuple of (fingerprint, duration_seconds)
+    """
+    hashes = []
+    frames = []
+    samples = 0
+    for block in blocks:
+        if samples % HOP_LENGTH:
+            raise ValueError(f"Fingerprint blocks must be a multiple of {HOP_LENGTH} samples long")
+        block_hashes, block_frames = compute_fingerprint(block, frame_offset=samples // HOP_LENGTH)
+        hashes.append(block_hashes)
+        frames.append(block_frames)
+        samples += len(block)
+
+    if not hashes:
+        return (np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)), 0.0
+    return (np.concatenate(hashes), np.concatenate(frames)), samples / SAMPLING_RATE
+
+
+def match_fingerprints(query: tuple, reference: tuple) -> tuple:
+    """
+    Align two fingerprints.
+
+    Args:
+        query: (hashes, frames) of the new file
+        reference: (hashes, frames) of an indexed file
+
+    Returns:
+        Tuple of (similarity, offset_frames). Similarity is the fraction of
+        hashes that agree on a single time offset; a query frame corresponds
+        to reference frame (query_frame - offset_frames).
+    """
+    q_hashes, q_frames = query
+    r_hashes, r_frames = reference
+    if len(q_hashes) == 0 or len(r_hashes) == 0:
+        return 0.0, 0
+
+    order = np.argsort(r_hashes, kind="stable")
+    r_hashes = r_hashes[order]
+    r_frames = r_frames[order]
+
+    lo = np.searchsorted(r_hashes, q_hashes, side="left")
+    counts = np.searchsorted(r_hashes, q_hashes, side="right") - lo
+    total = int(counts.sum())
+    if total == 0:
+        return 0.0, 0
+
+    # Expand every (query hash, matching reference hash) pair
+    query_idx = np.repeat(np.arange(len(q_hashes)), counts)
+    ref_idx = np.repeat(lo, counts) + (np.arange(total) - np.repeat(np.cumsum(counts) - counts, counts))
+    offsets = q_frames[query_idx] - r_frames[ref_idx]
+
+    values, votes = np.unique(offsets, return_counts=True)
+    best = int(np.argmax(votes))
+    similarity = votes[best] / max(len(q_hashes), len(r_hashes))
+    return float(similarity), int(values[best])
+
+
+def coverage(offset: float, reference_duration: float, duration: float) -> float:
+    """
+    Fraction of a query of the given duration covered by an aligned reference.
+
+    The reference spans [offset, offset + reference_duration] in query time.
+    """
+    if duration <= 0:
+        return 0.0
+    overlap = min(duration, offset + reference_duration) - max(0.0, offset)
+    return max(0.0, overlap) / duration
+
+
+def _encode_array(array: np.ndarray) -> str:
+    return base64.b64encode(array.astype("<i4").tobytes()).decode("ascii")
+
+
+def _decode_array(data: str) -> np.ndarray:
+    return np.frombuffer(base64.b64decode(data), dtype="<i4").astype(np.int64)
+
+
+class FingerprintIndex:
+    """JSON-backed index of fingerprints and the transcripts they produced."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.entries = []
+        self._fingerprints = []
+
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                self.entries = json.load(f).get("entries", [])
+            self._fingerprints = [
+                (_decode_array(e["hashes"]), _decode_array(e["frames"]))
+                for e in self.entries
+            ]
+
+    def find(self, fingerprint: tuple, threshold: float, duration: float = None, min_coverage: float = 0.0):
+        """
+        Find the best matching indexed file.
+
+        Args:
+            fingerprint: (hashes, frames) from compute_fingerprint
+            threshold: Minimum similarity to count as a duplicate
+            duration: Query duration in seconds, required for min_coverage
+            min_coverage: Minimum fraction of the query the aligned entry must
+                cover, so a file that only partly overlaps is not reused
+
+        Returns:
+            Tuple of (entry, offset_seconds, similarity), or None if nothing matches.
+            offset_seconds is added to the entry's timestamps to align them to the query.
+        """
+        best = None
+        for entry, reference in zip(self.entries, self._fingerprints):
+            similarity, offset = match_fingerprints(fingerprint, reference)
+            if similarity < threshold or (best is not None and similarity <= best[2]):
+                continue
+            offset = frames_to_seconds(offset)
+            if min_coverage and coverage(offset, entry["duration"], duration) < min_coverage:
+                continue
+            best = (entry, offset, similarity)
+        return best
+
+    def add(self, source: str, fingerprint: tuple, duration: float, segments: list,
+            language: str, language_probability: float, inference_seconds: float):
+        """Record a transcribed file. Call save() to persist."""
+        hashes, frames = fingerprint
+        self.entries.append({
+            "source": os.path.basename(source),
+            "duration": duration,
+            "language": language,
+            "language_probability": language_probability,
+            "inference_seconds": inference_seconds,
+            "segments": segments,
+            "hashes": _encode_array(hashes),
+            "frames": _encode_array(frames),
+        })
+        self._fingerprints.append((hashes, frames))
+
+    def save(self):
+        """Write the index to disk."""
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"version": 1, "entries": self.entries}, f, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
+
+
+def shift_segments(segments: list, offset: float, duration: float) -> list:
+    """Move indexed segments by offset seconds, dropping any outside [0, duration]."""
+    shifted = []
+    for seg in segments:
+        start = seg["start"] + offset
+        end = seg["end"] + offset
+        if end <= 0 or start >= duration:
+            continue
+        shifted.append({
+            "start": max(0.0, start),
+            "end": min(duration, end),
+            "text": seg["text"],
+        })
+    return shifted
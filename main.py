@@ -2,6 +2,9 @@ import argparse
 import os
 from faster_whisper import WhisperModel
 from tqdm import tqdm
+from audio_loader import DEFAULT_PREFETCH_FILES, DEFAULT_PREFETCH_MAX_SECONDS, load_audio, prefetch_audio
+from decoding import RtfController, save_quality_record, transcribe_adaptive
+from tracing import enable_tracing, save_trace, span, traced
 
 def format_timestamp(seconds: float) -> str:
     hours = int(seconds // 3600)
@@ -10,14 +13,24 @@ def format_timestamp(seconds: float) -> str:
     millis = int((seconds - int(seconds)) * 1000)
     return f"{hours:02}:{minutes:02}:{secs:02}.{millis:03}"
 
-def transcribe_file(input_file, output_file, model, segmented):
+def transcribe_file(input_file, output_file, model, segmented, audio=None, target_rtf=None):
     print(f"Transcribing {input_file}...")
     print(f"Output will be saved to {output_file}\n")
-    segments, info = model.transcribe(input_file)
+    controller = None
+    with span("transcribe start", "inference"):
+        if target_rtf is not None:
+            controller = RtfController(target_rtf)
+            if audio is None:
+                audio = load_audio(input_file)
+            segments, info = transcribe_adaptive(model, audio, controller)
+        else:
+            segments, info = model.transcribe(audio if audio is not None else input_file)
     transcript_text = []
     vtt_segments = []
     with tqdm(desc=f"Processing segments ({os.path.basename(input_file)})", unit="segment") as pbar:
-        for i, segment in enumerate(segments, 1):
+        for i, segment in enumerate(traced(segments, "segment", "inference"), 1):
+            if controller is not None:
+                controller.record(segment.start, segment.end)
             text = segment.text.strip()
             transcript_text.append(text)
             if segmented:
@@ -27,14 +40,20 @@ def transcribe_file(input_file, output_file, model, segmented):
             pbar.update(1)
             pbar.set_postfix_str(f"Current: {text[:50]}...")
     full_transcript = " ".join(transcript_text)
-    with open(output_file, 'w', encoding='utf-8') as f:
-        f.write(full_transcript)
+    with span("write", "io"):
+        with open(output_file, 'w', encoding='utf-8') as f:
+            f.write(full_transcript)
+        if segmented:
+            vtt_file = output_file.rsplit('.', 1)[0] + ".vtt"
+            with open(vtt_file, 'w', encoding='utf-8') as vtt:
+                vtt.write("WEBVTT\n\n")
+                vtt.writelines(vtt_segments)
     if segmented:
-        vtt_file = output_file.rsplit('.', 1)[0] + ".vtt"
-        with open(vtt_file, 'w', encoding='utf-8') as vtt:
-            vtt.write("WEBVTT\n\n")
-            vtt.writelines(vtt_segments)
         print(f"Segmented VTT output saved to: {vtt_file}")
+    if controller is not None:
+        quality_file = output_file.rsplit('.', 1)[0] + ".quality.json"
+        save_quality_record(quality_file, controller)
+        print(f"Quality tiers used: {', '.join(controller.summary()['tiers_used'])} (saved to {quality_file})")
     print(f"Transcription completed!")
     print(f"Text saved to: {output_file}")
     print(f"Language detected: {info.language}")
@@ -45,28 +64,50 @@ def main():
     parser.add_argument('-i', '--input', required=True, help='Input audio file path or directory')
     parser.add_argument('-o', '--output', help='Output text file path (used only for single file mode)')
     parser.add_argument('--segmented', action='store_true', help='Save segmented output as VTT file')
+    parser.add_argument('--prefetch', type=int, default=DEFAULT_PREFETCH_FILES, help=f'Files to decode ahead in directory mode, 0 disables (default: {DEFAULT_PREFETCH_FILES})')
+    parser.add_argument('--prefetch-max-seconds', type=float, default=DEFAULT_PREFETCH_MAX_SECONDS, help=f'Max decoded audio seconds waiting in the prefetch queue (default: {DEFAULT_PREFETCH_MAX_SECONDS})')
+    parser.add_argument('--target-rtf', type=float, metavar='RTF', help='Real-time-factor budget, e.g. 0.2 = finish within 0.2x media duration; decoding gets cheaper when behind')
+    parser.add_argument('--trace', metavar='OUT_JSON', help='Record per-stage timing spans to a Chrome trace file (open in Perfetto)')
     args = parser.parse_args()
+    if args.trace:
+        enable_tracing()
+    try:
+        run(args)
+    finally:
+        if args.trace:
+            save_trace(args.trace)
+
+def run(args):
     input_path = args.input
     output_file = args.output
     segmented = args.segmented
 
-    model = WhisperModel("deepdml/faster-whisper-large-v3-turbo-ct2")
+    with span("model load", "inference"):
+        model = WhisperModel("deepdml/faster-whisper-large-v3-turbo-ct2")
 
-    audio_exts = {'.wav', '.mp3', '.m4a', '.flac', '.ogg', '.aac', '.wma', '.mp4', '.webm', '.mkv', '.avi', '.mov'}
+    audio_exts = {'.wav', '.mp3', '.m4a', '.flac', '.ogg', '.opus', '.aac', '.wma', '.mp4', '.webm', '.mkv', '.avi', '.mov'}
 
     if os.path.isdir(input_path):
         files = [f for f in os.listdir(input_path) if os.path.splitext(f)[1].lower() in audio_exts]
         if not files:
             print("No audio files found in the specified directory.")
             return
-        for filename in files:
-            input_file = os.path.join(input_path, filename)
+        paths = [os.path.join(input_path, f) for f in files]
+        decoded = prefetch_audio(paths, args.prefetch, args.prefetch_max_seconds)
+        for input_file, audio, error in traced(decoded, "wait for decode", "audio"):
+            if error is not None:
+                print(f"Error decoding {input_file}: {error}")
+                continue
             output_txt = os.path.splitext(input_file)[0] + ".txt"
-            transcribe_file(input_file, output_txt, model, segmented)
+            with span("file", "pipeline", file=os.path.basename(input_file)):
+                transcribe_file(input_file, output_txt, model, segmented, audio, args.target_rtf)
+            # Release this file's audio before blocking on the next decode
+            audio = None
     elif os.path.isfile(input_path):
         if not output_file:
             output_file = os.path.splitext(input_path)[0] + ".txt"
-        transcribe_file(input_path, output_file, model, segmented)
+        with span("file", "pipeline", file=os.path.basename(input_path)):
+            transcribe_file(input_path, output_file, model, segmented, target_rtf=args.target_rtf)
     else:
         print(f"Error: {input_path} is not a valid file or directory.")
 
@@ -10,9 +10,11 @@ import os
 import mlx_whisper
 import json
 
+from tracing import enable_tracing, save_trace, span
+
 # Supported media extensions
 MEDIA_EXTENSIONS = {
-    ".wav", ".mp3", ".m4a", ".flac", ".ogg", ".aac", ".wma",  # Audio
+    ".wav", ".mp3", ".m4a", ".flac", ".ogg", ".opus", ".aac", ".wma",  # Audio
     ".mp4", ".webm", ".mkv", ".avi", ".mov"  # Video
 }
 
@@ -60,10 +62,13 @@ def transcribe_file(
     if language:
         transcribe_options["language"] = language
 
-    result = mlx_whisper.transcribe(input_file, **transcribe_options)
+    # mlx_whisper.transcribe decodes, loads the model and runs inference in one call
+    with span("transcribe", "inference", file=os.path.basename(input_file)):
+        result = mlx_whisper.transcribe(input_file, **transcribe_options)
 
     # Save output based on format
-    save_output(result, output_file, output_format)
+    with span("write", "io"):
+        save_output(result, output_file, output_format)
 
     print(f"Transcription saved to: {output_file}")
     return output_file
@@ -111,13 +116,14 @@ def transcribe_directory(
         print(f"\n[{i}/{len(files)}] Processing: {filename}")
 
         try:
-            output_file = transcribe_file(
-                input_file=input_file,
-                output_format=output_format,
-                model=model,
-                language=language,
-                word_timestamps=word_timestamps
-            )
+            with span("file", "pipeline", file=filename):
+                output_file = transcribe_file(
+                    input_file=input_file,
+                    output_format=output_format,
+                    model=model,
+                    language=language,
+                    word_timestamps=word_timestamps
+                )
             output_files.append(output_file)
         except Exception as e:
             print(f"Error transcribing '{filename}': {e}", file=sys.stderr)
@@ -211,6 +217,7 @@ def main():
     #   - --model: Whisper model to use (default: mlx-community/whisper-large-v3-turbo)
     #   - --word-timestamps: Include word-level timestamps
     #   - --language: Force specific language
+    #   - --trace: Write a Chrome trace of per-stage timings (open in Perfetto)
     #
     #   Output Formats:
     #   - txt: Plain text transcription
@@ -265,8 +272,17 @@ def main():
         help="Force specific language (e.g., 'en', 'ja')"
     )
 
+    parser.add_argument(
+        "--trace",
+        metavar="OUT_JSON",
+        help="Record per-stage timing spans to a Chrome trace file (open in Perfetto)"
+    )
+
     args = parser.parse_args()
 
+    if args.trace:
+        enable_tracing()
+
     # Check if input exists
     if not os.path.exists(args.input):
         print(f"Error: '{args.input}' not found.", file=sys.stderr)
@@ -297,6 +313,9 @@ def main():
     except Exception as e:
         print(f"Error: {e}", file=sys.stderr)
         sys.exit(1)
+    finally:
+        if args.trace:
+            save_trace(args.trace)
 
 
 if __name__ == "__main__":
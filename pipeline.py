@@ -10,14 +10,37 @@ import argparse
 import os
 import platform
 import sys
+import time
+from functools import partial
 
 from config import (
     DOWNLOAD_DIR,
     OUTPUT_FORMAT,
     LANGUAGE,
     DELETE_AFTER_TRANSCRIPTION,
+    DEDUP_ENABLED,
+    DEDUP_INDEX_FILE,
+    DEDUP_SIMILARITY_THRESHOLD,
+    DEDUP_MIN_COVERAGE,
+    PREFETCH_FILES,
+    PREFETCH_MAX_SECONDS,
+    WINDOWED_MIN_SECONDS,
+    WINDOW_SECONDS,
+    TWO_PASS,
+    TWO_PASS_BEAM_SIZE,
+    TWO_PASS_LOGPROB_THRESHOLD,
+    TWO_PASS_COMPRESSION_RATIO_THRESHOLD,
+    TWO_PASS_NO_SPEECH_THRESHOLD,
+    LOOP_GUARD,
+    LOOP_GUARD_WINDOW_SEGMENTS,
+    LOOP_GUARD_MIN_REPEATS,
+    LOOP_GUARD_MIN_REPEAT_CHARS,
+    LOOP_GUARD_NGRAM_SIZE,
+    LOOP_GUARD_NGRAM_REPEAT_RATIO,
+    LOOP_GUARD_COMPRESSION_RATIO,
 )
 from downloader import download_videos, get_downloaded_files
+from tracing import enable_tracing, save_trace, span, traced
 
 
 def detect_platform() -> str:
@@ -54,15 +77,74 @@ def transcribe_with_mlx(input_dir: str, output_format: str, language: str = None
     )
 
 
-def transcribe_with_faster_whisper(input_dir: str, output_format: str, language: str = None) -> list:
-    """Transcribe using faster-whisper (Windows/CPU)."""
+def transcribe_with_faster_whisper(
+    input_dir: str,
+    output_format: str,
+    language: str = None,
+    dedup_index: str = None,
+    dedup_threshold: float = 0.15,
+    dedup_min_coverage: float = 0.95,
+    prefetch_files: int = 2,
+    prefetch_max_seconds: float = 7200,
+    windowed_min_seconds: float = None,
+    window_seconds: float = 600,
+    two_pass: dict = None,
+    target_rtf: float = None,
+    loop_guard: dict = None
+) -> list:
+    """
+    Transcribe using faster-whisper (Windows/CPU).
+
+    Args:
+        input_dir: Directory containing media files
+        output_format: Output format - txt, vtt, srt
+        language: Force specific language (None for auto-detect)
+        dedup_index: Path to the fingerprint index, relative to input_dir unless
+            absolute. None disables duplicate detection
+        dedup_threshold: Minimum fingerprint similarity to reuse a transcript
+        dedup_min_coverage: Minimum fraction of a file the matched transcript must
+            cover. Partial overlaps are transcribed in full
+        prefetch_files: Number of files decoded ahead during inference (0 disables)
+        prefetch_max_seconds: Budget for decoded audio waiting in the prefetch queue
+        windowed_min_seconds: Files longer than this (or of unknown length) are decoded
+            window by window to bound memory. None always decodes whole files
+        window_seconds: Window length for windowed decoding
+        two_pass: Thresholds for two-pass decoding (greedy, then beam search on
+            low-confidence segments), passed to decoding.transcribe_two_pass.
+            None decodes with beam search throughout
+        target_rtf: Real-time-factor budget (compute seconds per audio second).
+            Decoding steps down to cheaper settings when behind it, and the tiers
+            used are recorded in <file>.quality.json. Takes precedence over two_pass
+        loop_guard: Repetition-loop detector settings, passed to
+            decoding.transcribe_loop_guarded. None disables the guard
+
+    Returns:
+        List of output file paths
+    """
     from faster_whisper import WhisperModel
     from tqdm import tqdm
 
-    model = WhisperModel("deepdml/faster-whisper-large-v3-turbo-ct2")
+    from audio_loader import iter_audio_blocks, load_audio, prefetch_audio, probe_duration
+    from decoding import (
+        RtfController,
+        add_loop_guard_stats,
+        add_two_pass_stats,
+        format_loop_guard_stats,
+        format_two_pass_stats,
+        new_loop_guard_stats,
+        new_two_pass_stats,
+        save_quality_record,
+        transcribe_adaptive,
+        transcribe_loop_guarded,
+        transcribe_two_pass,
+        transcribe_windowed,
+    )
+
+    with span("model load", "inference"):
+        model = WhisperModel("deepdml/faster-whisper-large-v3-turbo-ct2")
 
     media_extensions = {
-        ".wav", ".mp3", ".m4a", ".flac", ".ogg", ".aac", ".wma",
+        ".wav", ".mp3", ".m4a", ".flac", ".ogg", ".opus", ".aac", ".wma",
         ".mp4", ".webm", ".mkv", ".avi", ".mov"
     }
 
@@ -78,84 +160,226 @@ def transcribe_with_faster_whisper(input_dir: str, output_format: str, language:
     print(f"Found {len(files)} media file(s) in '{input_dir}'")
     print("-" * 50)
 
+    if target_rtf is not None and two_pass is not None:
+        print("Two-pass decoding disabled: --target-rtf selects decoding settings")
+        two_pass = None
+
+    index = None
+    if dedup_index:
+        from fingerprint import (
+            FingerprintIndex,
+            align_block_seconds,
+            compute_fingerprint,
+            fingerprint_blocks,
+            shift_segments,
+        )
+
+        index = FingerprintIndex(os.path.join(input_dir, dedup_index))
+        print(f"Duplicate detection: {len(index.entries)} indexed file(s)")
+
     output_files = []
+    reused_files = 0
+    reused_seconds = 0.0
+    saved_inference_seconds = 0.0
+    two_pass_totals = new_two_pass_stats()
+    loop_guard_totals = new_loop_guard_stats()
+
+    paths = [os.path.join(input_dir, f) for f in files]
+    decoded = prefetch_audio(
+        paths,
+        max_files=prefetch_files,
+        max_seconds=prefetch_max_seconds,
+        skip_seconds=windowed_min_seconds
+    )
 
-    for i, filename in enumerate(files, 1):
-        input_file = os.path.join(input_dir, filename)
+    for i, (input_file, audio, error) in enumerate(traced(decoded, "wait for decode", "audio"), 1):
+        filename = os.path.basename(input_file)
         base_name = os.path.splitext(input_file)[0]
 
         print(f"\n[{i}/{len(files)}] Processing: {filename}")
-        print(f"Transcribing '{input_file}'...")
-
-        try:
-            transcribe_options = {}
-            if language:
-                transcribe_options["language"] = language
-
-            segments, info = model.transcribe(input_file, **transcribe_options)
-
-            transcript_text = []
-            vtt_segments = []
-
-            with tqdm(desc=f"Processing segments", unit="segment") as pbar:
-                for seg_i, segment in enumerate(segments, 1):
-                    text = segment.text.strip()
-                    transcript_text.append(text)
-
-                    if output_format in ("vtt", "srt"):
-                        start = format_timestamp(segment.start)
-                        end = format_timestamp(segment.end)
-                        vtt_segments.append({
-                            "index": seg_i,
-                            "start": start,
-                            "end": end,
+
+        with span("file", "pipeline", file=filename):
+            try:
+                if error is not None:
+                    raise error
+
+                windowed = False
+                if audio is None and windowed_min_seconds is not None:
+                    duration_hint = probe_duration(input_file)
+                    windowed = duration_hint is None or duration_hint > windowed_min_seconds
+
+                if index is not None:
+                    if windowed:
+                        with span("fingerprint", "dedup"):
+                            fingerprint, duration = fingerprint_blocks(
+                                iter_audio_blocks(input_file, align_block_seconds(window_seconds))
+                            )
+                    else:
+                        if audio is None:
+                            audio = load_audio(input_file)
+                        duration = len(audio) / 16000
+                        with span("fingerprint", "dedup"):
+                            fingerprint = compute_fingerprint(audio)
+
+                    with span("match", "dedup"):
+                        match = index.find(fingerprint, dedup_threshold, duration, dedup_min_coverage)
+                    if match:
+                        entry, offset, similarity = match
+                        print(f"Duplicate of '{entry['source']}' "
+                              f"(similarity: {similarity:.2f}, offset: {offset:+.2f}s), reusing transcript")
+                        segments = shift_segments(entry["segments"], offset, duration)
+                        with span("write", "io"):
+                            output_file = save_transcript(base_name, output_format, segments)
+                        print(f"Transcription saved to: {output_file}")
+                        output_files.append(output_file)
+                        reused_files += 1
+                        reused_seconds += duration
+                        saved_inference_seconds += entry["inference_seconds"] * duration / max(entry["duration"], 1e-6)
+                        continue
+
+                print(f"Transcribing '{input_file}'...")
+
+                transcribe_options = {}
+                if language:
+                    transcribe_options["language"] = language
+
+                transcribe = model.transcribe
+                controller = None
+                if target_rtf is not None:
+                    controller = RtfController(target_rtf)
+                    transcribe = partial(transcribe_adaptive, model, controller=controller)
+                    # Lets windowed decoding tell the controller where each window starts
+                    transcribe_options["clip_start"] = 0.0
+                    if audio is None and not windowed:
+                        audio = load_audio(input_file)
+                elif two_pass is not None:
+                    two_pass_stats = new_two_pass_stats()
+                    transcribe = partial(transcribe_two_pass, model, stats=two_pass_stats, **two_pass)
+                    if audio is None and not windowed:
+                        audio = load_audio(input_file)
+
+                if loop_guard is not None:
+                    loop_guard_stats = new_loop_guard_stats()
+                    transcribe = partial(transcribe_loop_guarded, transcribe, stats=loop_guard_stats, **loop_guard)
+                    if audio is None and not windowed:
+                        audio = load_audio(input_file)
+
+                started = time.perf_counter()
+                with span("transcribe start", "inference"):
+                    if windowed:
+                        print(f"Long input: decoding in {window_seconds:.0f}s windows")
+                        segments, info = transcribe_windowed(transcribe, input_file, window_seconds, **transcribe_options)
+                    else:
+                        segments, info = transcribe(
+                            audio if audio is not None else input_file,
+                            **transcribe_options
+                        )
+
+                transcript_segments = []
+
+                with tqdm(desc=f"Processing segments", unit="segment") as pbar:
+                    for segment in traced(segments, "segment", "inference"):
+                        if controller is not None:
+                            controller.record(segment.start, segment.end)
+                        text = segment.text.strip()
+                        transcript_segments.append({
+                            "start": segment.start,
+                            "end": segment.end,
                             "text": text
                         })
 
-                    pbar.update(1)
-                    pbar.set_postfix_str(f"Current: {text[:50]}...")
-
-            # Save output
-            if output_format == "txt":
-                output_file = f"{base_name}.txt"
-                with open(output_file, "w", encoding="utf-8") as f:
-                    f.write(" ".join(transcript_text))
-
-            elif output_format == "vtt":
-                output_file = f"{base_name}.vtt"
-                with open(output_file, "w", encoding="utf-8") as f:
-                    f.write("WEBVTT\n\n")
-                    for seg in vtt_segments:
-                        f.write(f"{seg['start']} --> {seg['end']}\n")
-                        f.write(f"{seg['text']}\n\n")
-
-            elif output_format == "srt":
-                output_file = f"{base_name}.srt"
-                with open(output_file, "w", encoding="utf-8") as f:
-                    for seg in vtt_segments:
-                        f.write(f"{seg['index']}\n")
-                        f.write(f"{seg['start']} --> {seg['end']}\n")
-                        f.write(f"{seg['text']}\n\n")
-
-            else:
-                # Default to txt
-                output_file = f"{base_name}.txt"
-                with open(output_file, "w", encoding="utf-8") as f:
-                    f.write(" ".join(transcript_text))
-
-            print(f"Transcription saved to: {output_file}")
-            print(f"Language detected: {info.language} (probability: {info.language_probability:.2f})")
-            output_files.append(output_file)
-
-        except Exception as e:
-            print(f"Error transcribing '{filename}': {e}", file=sys.stderr)
+                        pbar.update(1)
+                        pbar.set_postfix_str(f"Current: {text[:50]}...")
+
+                inference_seconds = time.perf_counter() - started
+                with span("write", "io"):
+                    output_file = save_transcript(base_name, output_format, transcript_segments)
+
+                print(f"Transcription saved to: {output_file}")
+                print(f"Language detected: {info.language} (probability: {info.language_probability:.2f})")
+                if controller is not None:
+                    save_quality_record(f"{base_name}.quality.json", controller)
+                    summary = controller.summary()
+                    print(f"Quality tiers: {', '.join(summary['tiers_used']) or 'none'} "
+                          f"(RTF {summary['achieved_rtf'] or 0:.3f}, target {target_rtf})")
+                if two_pass is not None:
+                    print(f"Two-pass: {format_two_pass_stats(two_pass_stats)}")
+                    add_two_pass_stats(two_pass_totals, two_pass_stats)
+                if loop_guard is not None and loop_guard_stats["loops"]:
+                    print(f"Loop guard: {format_loop_guard_stats(loop_guard_stats)}")
+                    add_loop_guard_stats(loop_guard_totals, loop_guard_stats)
+                output_files.append(output_file)
+
+                if index is not None:
+                    index.add(
+                        source=input_file,
+                        fingerprint=fingerprint,
+                        duration=duration,
+                        segments=transcript_segments,
+                        language=info.language,
+                        language_probability=info.language_probability,
+                        inference_seconds=inference_seconds
+                    )
+                    with span("index save", "io"):
+                        index.save()
+
+            except Exception as e:
+                print(f"Error transcribing '{filename}': {e}", file=sys.stderr)
+            finally:
+                # Release this file's audio (the segment generators hold it too)
+                # before blocking on the next decode
+                audio = segments = None
 
     print("-" * 50)
     print(f"Transcription complete. Processed: {len(output_files)}/{len(files)} files")
+    if index is not None:
+        print(f"Duplicates reused: {reused_files} file(s), {reused_seconds:.1f}s of audio, "
+              f"~{saved_inference_seconds:.1f}s of inference saved")
+    if two_pass is not None:
+        print(f"Two-pass total: {format_two_pass_stats(two_pass_totals)}")
+    if loop_guard is not None:
+        print(f"Loop guard total: {format_loop_guard_stats(loop_guard_totals)}")
 
     return output_files
 
 
+def save_transcript(base_name: str, output_format: str, segments: list) -> str:
+    """
+    Write transcript segments next to the source file.
+
+    Args:
+        base_name: Source file path without extension
+        output_format: Output format - txt, vtt, srt (anything else falls back to txt)
+        segments: List of {"start", "end", "text"} dicts
+
+    Returns:
+        Path to the output file
+    """
+    if output_format == "vtt":
+        output_file = f"{base_name}.vtt"
+        with open(output_file, "w", encoding="utf-8") as f:
+            f.write("WEBVTT\n\n")
+            for seg in segments:
+                f.write(f"{format_timestamp(seg['start'])} --> {format_timestamp(seg['end'])}\n")
+                f.write(f"{seg['text']}\n\n")
+
+    elif output_format == "srt":
+        output_file = f"{base_name}.srt"
+        with open(output_file, "w", encoding="utf-8") as f:
+            for seg_i, seg in enumerate(segments, 1):
+                f.write(f"{seg_i}\n")
+                f.write(f"{format_timestamp(seg['start'])} --> {format_timestamp(seg['end'])}\n")
+                f.write(f"{seg['text']}\n\n")
+
+    else:
+        # Default to txt
+        output_file = f"{base_name}.txt"
+        with open(output_file, "w", encoding="utf-8") as f:
+            f.write(" ".join(seg["text"] for seg in segments))
+
+    return output_file
+
+
 def format_timestamp(seconds: float) -> str:
     """Format seconds as HH:MM:SS.mmm for VTT/SRT."""
     hours = int(seconds // 3600)
@@ -168,7 +392,7 @@ def format_timestamp(seconds: float) -> str:
 def cleanup_media_files(directory: str) -> int:
     """Delete media files after successful transcription."""
     media_extensions = {
-        ".wav", ".mp3", ".m4a", ".flac", ".ogg", ".aac", ".wma",
+        ".wav", ".mp3", ".m4a", ".flac", ".ogg", ".opus", ".aac", ".wma",
         ".mp4", ".webm", ".mkv", ".avi", ".mov"
     }
 
@@ -187,13 +411,14 @@ def cleanup_media_files(directory: str) -> int:
     return deleted
 
 
-def run_pipeline(download_only: bool = False, transcribe_only: bool = False):
+def run_pipeline(download_only: bool = False, transcribe_only: bool = False, target_rtf: float = None):
     """
     Run the full pipeline: download -> transcribe -> cleanup.
 
     Args:
         download_only: Only download, skip transcription
         transcribe_only: Only transcribe existing files, skip download
+        target_rtf: Real-time-factor budget for faster-whisper decoding (None = fixed settings)
     """
     print("=" * 60)
     print("YouTube Download & Transcription Pipeline")
@@ -207,13 +432,18 @@ def run_pipeline(download_only: bool = False, transcribe_only: bool = False):
     print(f"Output format: {OUTPUT_FORMAT}")
     print(f"Language: {LANGUAGE if LANGUAGE else 'auto-detect'}")
     print(f"Download directory: {os.path.abspath(DOWNLOAD_DIR)}")
+    print(f"Duplicate detection: {'on' if DEDUP_ENABLED else 'off'}")
+    print(f"Two-pass decoding: {'on' if TWO_PASS else 'off'}")
+    print(f"Target RTF: {target_rtf if target_rtf is not None else 'off'}")
+    print(f"Loop guard: {'on' if LOOP_GUARD else 'off'}")
     print("=" * 60)
 
     # Phase 1: Download
     if not transcribe_only:
         print("\n[Phase 1] Downloading videos...")
         print("-" * 50)
-        downloaded = download_videos()
+        with span("download phase", "pipeline"):
+            downloaded = download_videos()
         if not downloaded and not transcribe_only:
             print("No videos downloaded.")
     else:
@@ -235,16 +465,46 @@ def run_pipeline(download_only: bool = False, transcribe_only: bool = False):
         print("\nPipeline complete (no files to transcribe).")
         return
 
-    if engine == "mlx":
-        output_files = transcribe_with_mlx(DOWNLOAD_DIR, OUTPUT_FORMAT, LANGUAGE)
-    else:
-        output_files = transcribe_with_faster_whisper(DOWNLOAD_DIR, OUTPUT_FORMAT, LANGUAGE)
+    with span("transcribe phase", "pipeline"):
+        if engine == "mlx":
+            if target_rtf is not None:
+                print("Note: --target-rtf is only supported by faster-whisper; ignored")
+            output_files = transcribe_with_mlx(DOWNLOAD_DIR, OUTPUT_FORMAT, LANGUAGE)
+        else:
+            output_files = transcribe_with_faster_whisper(
+                DOWNLOAD_DIR,
+                OUTPUT_FORMAT,
+                LANGUAGE,
+                dedup_index=DEDUP_INDEX_FILE if DEDUP_ENABLED else None,
+                dedup_threshold=DEDUP_SIMILARITY_THRESHOLD,
+                dedup_min_coverage=DEDUP_MIN_COVERAGE,
+                prefetch_files=PREFETCH_FILES,
+                prefetch_max_seconds=PREFETCH_MAX_SECONDS,
+                windowed_min_seconds=WINDOWED_MIN_SECONDS,
+                window_seconds=WINDOW_SECONDS,
+                two_pass={
+                    "beam_size": TWO_PASS_BEAM_SIZE,
+                    "logprob_threshold": TWO_PASS_LOGPROB_THRESHOLD,
+                    "compression_ratio_threshold": TWO_PASS_COMPRESSION_RATIO_THRESHOLD,
+                    "no_speech_threshold": TWO_PASS_NO_SPEECH_THRESHOLD,
+                } if TWO_PASS else None,
+                target_rtf=target_rtf,
+                loop_guard={
+                    "window_segments": LOOP_GUARD_WINDOW_SEGMENTS,
+                    "min_repeats": LOOP_GUARD_MIN_REPEATS,
+                    "min_repeat_chars": LOOP_GUARD_MIN_REPEAT_CHARS,
+                    "ngram_size": LOOP_GUARD_NGRAM_SIZE,
+                    "ngram_repeat_ratio": LOOP_GUARD_NGRAM_REPEAT_RATIO,
+                    "compression_ratio": LOOP_GUARD_COMPRESSION_RATIO,
+                } if LOOP_GUARD else None
+            )
 
     # Phase 3: Cleanup
     if DELETE_AFTER_TRANSCRIPTION and output_files:
         print("\n[Phase 3] Cleaning up media files...")
         print("-" * 50)
-        deleted = cleanup_media_files(DOWNLOAD_DIR)
+        with span("cleanup phase", "pipeline"):
+            deleted = cleanup_media_files(DOWNLOAD_DIR)
         print(f"Deleted {deleted} media file(s)")
     else:
         print("\n[Phase 3] Cleanup skipped (DELETE_AFTER_TRANSCRIPTION=False)")
@@ -275,16 +535,38 @@ def main():
         help="Only transcribe existing files, skip download"
     )
 
+    parser.add_argument(
+        "--target-rtf",
+        type=float,
+        metavar="RTF",
+        help="Real-time-factor budget, e.g. 0.2 = finish within 0.2x media duration "
+             "(faster-whisper only; decoding gets cheaper when behind)"
+    )
+
+    parser.add_argument(
+        "--trace",
+        metavar="OUT_JSON",
+        help="Record per-stage timing spans to a Chrome trace file (open in Perfetto)"
+    )
+
     args = parser.parse_args()
 
     if args.download_only and args.transcribe_only:
         print("Error: Cannot use both --download-only and --transcribe-only", file=sys.stderr)
         sys.exit(1)
 
-    run_pipeline(
-        download_only=args.download_only,
-        transcribe_only=args.transcribe_only
-    )
+    if args.trace:
+        enable_tracing()
+
+    try:
+        run_pipeline(
+            download_only=args.download_only,
+            transcribe_only=args.transcribe_only,
+            target_rtf=args.target_rtf
+        )
+    finally:
+        if args.trace:
+            save_trace(args.trace)
 
 
 if __name__ == "__main__":
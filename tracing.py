@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+"""
+Lightweight span tracing in Chrome trace event format.
+Traces open in Perfetto (https://ui.perfetto.dev) or chrome://tracing.
+
+Tracing is off until enable_tracing() is called; until then span() returns
+a shared no-op context manager and traced() returns its argument unchanged.
+"""
+
+import contextlib
+import json
+import os
+import threading
+import time
+
+_events = None  # List of trace events while tracing is enabled
+_origin_ns = 0
+_threads = {}
+
+_NULL_SPAN = contextlib.nullcontext()
+
+
+def enable_tracing():
+    """Start recording spans."""
+    global _events, _origin_ns
+    _events = []
+    _threads.clear()
+    _origin_ns = time.perf_counter_ns()
+
+
+def tracing_enabled() -> bool:
+    """Return True if spans are being recorded."""
+    return _events is not None
+
+
+def _now_us() -> float:
+    return (time.perf_counter_ns() - _origin_ns) / 1000
+
+
+def _tid() -> int:
+    tid = threading.get_ident()
+    if tid not in _threads:
+        _threads[tid] = threading.current_thread().name
+    return tid
+
+
+class _Span:
+    __slots__ = ("name", "cat", "args", "start")
+
+    def __init__(self, name, cat, args):
+        self.name = name
+        self.cat = cat
+        self.args = args
+
+    def __enter__(self):
+        self.start = _now_us()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if _events is None:
+            return False
+        event = {
+            "name": self.name,
+            "cat": self.cat,
+            "ph": "X",
+            "ts": self.start,
+            "dur": _now_us() - self.start,
+            "pid": os.getpid(),
+            "tid": _tid(),
+        }
+        if exc_type is not None:
+            self.args = dict(self.args, error=exc_type.__name__)
+        if self.args:
+            event["args"] = self.args
+        _events.append(event)
+        return False
+
+
+def span(name: str, cat: str = "pipeline", **args):
+    """
+    Time a block of code.
+
+    Usage:
+        with span("decode", "audio", file=path):
+            ...
+    """
+    if _events is None:
+        return _NULL_SPAN
+    return _Span(name, cat, args)
+
+
+def begin(name: str, cat: str = "pipeline", **args):
+    """Open a span that is closed by a later end() on the same thread (for callback hooks)."""
+    if _events is None:
+        return
+    event = {"name": name, "cat": cat, "ph": "B", "ts": _now_us(), "pid": os.getpid(), "tid": _tid()}
+    if args:
+        event["args"] = args
+    _events.append(event)
+
+
+def end(name: str, cat: str = "pipeline"):
+    """Close a span opened with begin()."""
+    if _events is None:
+        return
+    _events.append({"name": name, "cat": cat, "ph": "E", "ts": _now_us(), "pid": os.getpid(), "tid": _tid()})
+
+
+def traced(iterable, name: str, cat: str = "pipeline"):
+    """Wrap an iterator so that producing each item is recorded as a span."""
+    if _events is None:
+        return iterable
+
+    def generate():
+        iterator = iter(iterable)
+        while True:
+            with span(name, cat):
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    return
+            yield item
+            # Don't keep the item alive while producing the next one
+            item = None
+
+    return generate()
+
+
+def save_trace(path: str):
+    """Write recorded events as a Chrome trace JSON file."""
+    if _events is None:
+        return
+    metadata = [
+        {"name": "thread_name", "ph": "M", "pid": os.getpid(), "tid": tid, "args": {"name": name}}
+        for tid, name in list(_threads.items())
+    ]
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"traceEvents": metadata + _events, "displayTimeUnit": "ms"}, f)
+    print(f"Trace saved to: {path}")